@@ -0,0 +1,55 @@
+"""
+Cold start cost: importing the server and rendering the first OFFER
+
+Run from the repository root in a fresh micropython interpreter, the server
+needs usocket and uasyncio:
+
+    bin/micropython benchmarks/bench_import.py
+
+Times are cumulative from the first import. Each figure is a single
+measurement, so run it a few times.
+"""
+import sys
+
+sys.path.insert(0, "micropython_captive_dhcp_server")
+sys.path.insert(1, "libs/micropython")
+
+import time  # noqa: E402
+
+ticks_us = time.ticks_us
+ticks_diff = time.ticks_diff
+
+DISCOVER = (
+    b"\x01\x01\x06\x00\x2e\xf9\x31\x7f" + bytes(20) + b"\x08\x00\x27\x92\x1f\xae"
+) + bytes(202) + b"\x63\x82\x53\x63\x35\x01\x01\xff"
+
+
+class Socket:
+    def sendto(self, data, addr):
+        self.sent = bytes(data)
+
+
+def main():
+    start = ticks_us()
+    import packet  # noqa: F401
+
+    imported_packet = ticks_us()
+    from server import CaptiveDhcpServer
+    from log import Logger
+
+    imported_server = ticks_us()
+    server = CaptiveDhcpServer(log=Logger(Logger.OFF))
+    server.configure("192.168.4.1", "255.255.255.0")
+    server.sock = Socket()
+    server.handle(DISCOVER)
+    offered = ticks_us()
+
+    print(sys.implementation.name)
+    print("{:<28} {:>9} us".format("import packet", ticks_diff(imported_packet, start)))
+    print("{:<28} {:>9} us".format("import server", ticks_diff(imported_server, start)))
+    print("{:<28} {:>9} us".format("first offer", ticks_diff(offered, start)))
+    print("{:<28} {:>12}".format("json imported", str("json" in sys.modules)))
+    assert server.sock.sent[0] == 2
+
+
+main()
@@ -0,0 +1,189 @@
+"""
+Per-packet cost of the packet codec
+
+Run from the repository root on either runtime:
+
+    python3 benchmarks/bench_packet.py
+    bin/micropython benchmarks/bench_packet.py
+
+Heap is the bytes allocated by a single call: the exact gc.mem_alloc delta
+on micropython, the tracemalloc peak on CPython.
+"""
+import sys
+
+sys.path.insert(0, ".")
+sys.path.insert(1, "libs/micropython")
+
+import gc  # noqa: E402
+import time  # noqa: E402
+
+from micropython_captive_dhcp_server.packet import (  # noqa: E402
+    Header,
+    DhcpOptions,
+    DhcpOffer,
+    PacketPool,
+    Prefilter,
+)
+from micropython_captive_dhcp_server.test.test_packet import TestHeader  # noqa: E402
+
+ROUNDS = 2000
+BUFFER = bytearray(Header.MAX_PACKET_SIZE)
+POOL = PacketPool()
+PREFILTER = Prefilter()
+JUNK = bytes(300)
+OFFER = DhcpOffer.template("192.168.4.1", "255.255.255.0")
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError:
+
+    def ticks_us():
+        return int(time.perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+
+def heap(fn, arg):
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        fn(arg)
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used
+
+    import tracemalloc
+
+    tracemalloc.start()
+    fn(arg)
+    used = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return used
+
+
+def retained(fn, arg):
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        before = gc.mem_alloc()
+        result = fn(arg)
+        gc.collect()
+        used = gc.mem_alloc() - before
+        return used, result
+
+    import tracemalloc
+
+    tracemalloc.start()
+    result = fn(arg)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used, result
+
+
+def timed(fn, arg):
+    start = ticks_us()
+    for _ in range(ROUNDS):
+        fn(arg)
+    return ticks_diff(ticks_us(), start) / ROUNDS
+
+
+def report(name, fn, arg):
+    fn(arg)
+    print(
+        "{:<28} {:>9.1f} us {:>7} heap bytes".format(
+            name, timed(fn, arg), heap(fn, arg)
+        )
+    )
+
+
+def unpack(data):
+    Header().unpack(data)
+
+
+def parse_lazy(data):
+    header = Header.parse(data, lazy=True).header
+    header.options.get(DhcpOptions.CLIENT_ID)
+    header.options.get(DhcpOptions.REQUESTED_IP)
+
+
+def parse_lazy_any(data):
+    Header.parse(data, lazy=True)
+
+
+def parse(data):
+    header = Header.parse(data).header
+    header.options.get(DhcpOptions.CLIENT_ID)
+    header.options.get(DhcpOptions.REQUESTED_IP)
+
+
+def parse_pooled(data):
+    packet = POOL.parse(data)
+    packet.header.options.get(DhcpOptions.CLIENT_ID)
+    packet.header.options.get(DhcpOptions.REQUESTED_IP)
+    POOL.release(packet)
+
+
+def render_into(packet):
+    OFFER.render_into(BUFFER, packet.header, 0xC0A804FA)
+
+
+def reply_to(data):
+    OFFER.reply_to(data, 0xC0A804FA)
+
+
+def prefilter(data):
+    PREFILTER.accept(data)
+
+
+def access(packet):
+    header = packet.header
+    for _ in range(10):
+        header.xid
+        header.flags
+        header.yiaddr
+        header.options
+
+
+def pack(header):
+    header.pack()
+
+
+def pack_into(header):
+    header.pack_into(BUFFER)
+
+
+def main():
+    print(sys.implementation.name)
+    report("unpack discover_android", unpack, TestHeader.discover_android)
+    report("unpack discover_linux", unpack, TestHeader.discover_linux)
+    report("unpack request_linux", unpack, TestHeader.request_linux)
+    report("parse discover_android", parse, TestHeader.discover_android)
+    report("parse lazy discover_android", parse_lazy, TestHeader.discover_android)
+    report("parse pool discover_android", parse_pooled, TestHeader.discover_android)
+    report("prefilter discover_android", prefilter, TestHeader.discover_android)
+    report("prefilter offer_linux", prefilter, TestHeader.offer_linux)
+    report("prefilter zeros", prefilter, JUNK)
+    report("parse lazy zeros", parse_lazy_any, JUNK)
+    print(
+        "{:<28} {:>12} retained bytes".format(
+            "parse discover_android",
+            retained(Header.parse, TestHeader.discover_android)[0],
+        )
+    )
+    report(
+        "attribute access x40", access, Header.parse(TestHeader.discover_android)
+    )
+
+    discover = Header.parse(TestHeader.discover_linux)
+    report("render_into offer", render_into, discover)
+    report("reply_to offer", reply_to, TestHeader.discover_linux)
+
+    offer = Header()
+    offer.unpack(TestHeader.offer_linux)
+    report("pack offer_linux", pack, offer)
+    report("pack_into offer_linux", pack_into, offer)
+
+
+main()
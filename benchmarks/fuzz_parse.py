@@ -0,0 +1,154 @@
+"""
+Fuzzes the packet parser with random and mutated datagrams
+
+Run from the repository root on either runtime:
+
+    python3 benchmarks/fuzz_parse.py [iterations] [seed]
+    bin/micropython benchmarks/fuzz_parse.py [iterations] [seed]
+
+Datagrams are random octets or the test fixtures with flipped bits,
+truncated, or with random option lists. Each one goes through the prefilter,
+a lazy and an eager unpack, a read of every option and str(). Any exception
+is a bug and is reported with the datagram. The worst case time of a lazy
+unpack plus option reads is reported per mutation.
+"""
+import sys
+
+sys.path.insert(0, ".")
+sys.path.insert(1, "libs/micropython")
+
+import random  # noqa: E402
+import time  # noqa: E402
+
+from micropython_captive_dhcp_server.packet import Header, Prefilter  # noqa: E402
+from micropython_captive_dhcp_server.test.test_packet import TestHeader  # noqa: E402
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError:
+
+    def ticks_us():
+        return int(time.perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+
+FIXTURES = [
+    TestHeader.discover_android,
+    TestHeader.discover_linux,
+    TestHeader.request_linux,
+    TestHeader.offer_linux,
+    TestHeader.ack_linux,
+    TestHeader.rouge,
+]
+
+
+def random_bytes(length):
+    return bytes([random.getrandbits(8) for _ in range(length)])
+
+
+def noise():
+    return random_bytes(random.getrandbits(10) % 600)
+
+
+def flip_bits():
+    packet = bytearray(random.choice(FIXTURES))
+    for _ in range(1 + random.getrandbits(4)):
+        i = random.getrandbits(16) % len(packet)
+        packet[i] ^= 1 << random.getrandbits(3)
+    return packet
+
+
+def truncate():
+    packet = random.choice(FIXTURES)
+    return packet[: random.getrandbits(16) % (len(packet) + 1)]
+
+
+def random_options():
+    # A valid fixed header and magic followed by hostile option lists
+    packet = bytearray(random.choice(FIXTURES)[:240])
+    for _ in range(random.getrandbits(5)):
+        kind = random.getrandbits(2)
+        if kind == 0:
+            packet.append(0)
+        elif kind == 1:
+            packet += bytes([random.getrandbits(8), random.getrandbits(8)])
+        else:
+            length = random.getrandbits(8)
+            packet += bytes([random.getrandbits(8), length])
+            packet += random_bytes(random.getrandbits(8) % (length + 8))
+    if random.getrandbits(1):
+        packet.append(255)
+    return packet
+
+
+MUTATIONS = (
+    ("noise", noise),
+    ("flip bits", flip_bits),
+    ("truncate", truncate),
+    ("random options", random_options),
+)
+
+
+def read_all(header):
+    for option_code in header.options:
+        header.options[option_code]
+
+
+def check(data, prefilter):
+    prefilter.accept(data)
+
+    start = ticks_us()
+    header = Header()
+    well_formed = header.unpack(data, lazy=True)
+    read_all(header)
+    elapsed = ticks_diff(ticks_us(), start)
+
+    eager = Header()
+    eager.unpack(data)
+    str(eager)
+    return elapsed, well_formed
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    random.seed(int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+
+    prefilter = Prefilter()
+    failures = 0
+    print(sys.implementation.name)
+    print(
+        "{:<16} {:>9} {:>10} {:>10}".format(
+            "mutation", "malformed", "mean us", "worst us"
+        )
+    )
+    for name, mutate in MUTATIONS:
+        malformed = 0
+        total = 0
+        worst = 0
+        for _ in range(iterations):
+            data = bytes(mutate())
+            try:
+                elapsed, well_formed = check(data, prefilter)
+            except Exception as e:
+                failures += 1
+                print("{}: {!r} on {}".format(name, e, data))
+                continue
+            malformed += not well_formed
+            total += elapsed
+            worst = max(worst, elapsed)
+        print(
+            "{:<16} {:>9} {:>10.1f} {:>10}".format(
+                name, malformed, total / iterations, worst
+            )
+        )
+
+    print("prefilter: {}".format(prefilter))
+    print("{} exceptions".format(failures))
+    return failures
+
+
+if main():
+    sys.exit(1)
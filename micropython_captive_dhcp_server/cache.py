@@ -0,0 +1,143 @@
+from array import array
+
+try:
+    from micropython_captive_dhcp_server.packet import Header, Prefilter
+    from micropython_captive_dhcp_server.lease import ticks_ms, ticks_diff
+except Exception:
+    from packet import Header, Prefilter
+    from lease import ticks_ms, ticks_diff
+
+
+class ReplyCache:
+    """
+    This class models a small LRU of the replies last sent
+
+    Clients retransmit DISCOVER and REQUEST with the same xid until they are
+    answered. A request with the xid, hardware address and message type of a
+    reply sent less than window_ms ago is a retransmit. With the REPLAY
+    policy the stored reply is sent again, with DROP it is ignored. Either
+    way nothing is parsed, leased or packed.
+
+    Keys and replies are copied into buffers allocated up front, so storing
+    and finding allocate nothing. size 0 disables the cache.
+    """
+
+    REPLAY = 0
+    DROP = 1
+
+    # xid (4 octets), hardware address (6 octets), message type (1 octet)
+    KEY_SIZE = 11
+
+    def __init__(self, size: int = 8, window_ms: int = 10000, policy: int = REPLAY):
+        self.window_ms: int = window_ms
+        self.policy: int = policy
+        self.keys = bytearray(size * self.KEY_SIZE)
+        self.replies = [bytearray(Header.MAX_PACKET_SIZE) for _ in range(size)]
+        self.sizes = array("H", [0] * size)  # 0 marks an empty slot
+        self.stored = [0] * size  # ticks_ms the reply was sent
+        self.used = [0] * size  # ticks_ms of the last store or hit
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self):
+        return len(self.sizes) - list(self.sizes).count(0)
+
+    def matches(self, slot: int, data, message_type: int):
+        keys = self.keys
+        position = slot * self.KEY_SIZE
+        if keys[position + 10] != message_type:
+            return False
+        for i in range(4):
+            if keys[position + i] != data[4 + i]:
+                return False
+        for i in range(6):
+            if keys[position + 4 + i] != data[28 + i]:
+                return False
+        return True
+
+    def find(self, data, now: int = None):
+        """
+        Returns the slot of the reply to data if it is a retransmit, else None
+        """
+        sizes = self.sizes
+        if not len(sizes):
+            return None
+        if now is None:
+            now = ticks_ms()
+
+        message_type = Prefilter.message_type(data)
+        keys = self.keys
+        low = data[7]
+        position = 3
+        for slot in range(len(sizes)):
+            # The low xid octet rejects almost every other client first
+            if keys[position] == low and sizes[slot]:
+                if self.matches(slot, data, message_type):
+                    if ticks_diff(now, self.stored[slot]) >= self.window_ms:
+                        break
+                    self.used[slot] = now
+                    self.hits += 1
+                    return slot
+            position += self.KEY_SIZE
+
+        self.misses += 1
+        return None
+
+    def reply(self, slot: int):
+        """
+        Returns a view of the reply stored in slot
+        """
+        return memoryview(self.replies[slot])[: self.sizes[slot]]
+
+    def store(self, data, reply, now: int = None):
+        """
+        Copies reply, sent in answer to data, replacing the stale entry for the
+        same request or else the least recently used
+        """
+        sizes = self.sizes
+        if not len(sizes):
+            return None
+        if now is None:
+            now = ticks_ms()
+
+        message_type = Prefilter.message_type(data)
+        keys = self.keys
+        used = self.used
+        low = data[7]
+        victim = 0
+        oldest = 0
+        position = 3
+        for slot in range(len(sizes)):
+            if not sizes[slot]:
+                victim = slot
+                break
+            if keys[position] == low and self.matches(slot, data, message_type):
+                victim = slot
+                break
+            age = ticks_diff(now, used[slot])
+            if age > oldest:
+                victim = slot
+                oldest = age
+            position += self.KEY_SIZE
+
+        position = victim * self.KEY_SIZE
+        for i in range(4):
+            keys[position + i] = data[4 + i]
+        for i in range(6):
+            keys[position + 4 + i] = data[28 + i]
+        keys[position + 10] = message_type
+        self.replies[victim][: len(reply)] = reply
+        sizes[victim] = len(reply)
+        self.stored[victim] = now
+        self.used[victim] = now
+        return victim
+
+    def clear(self):
+        for slot in range(len(self.sizes)):
+            self.sizes[slot] = 0
+
+    def __str__(self):
+        return "{} hits, {} misses, {} of {} replies cached".format(
+            self.hits, self.misses, len(self), len(self.sizes)
+        )
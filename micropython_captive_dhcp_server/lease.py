@@ -0,0 +1,274 @@
+from array import array
+
+try:
+    from time import ticks_ms, ticks_us, ticks_add, ticks_diff
+except ImportError:
+    # CPython has no ticks_* helpers. Mirror the micropython wraparound semantics.
+    from time import monotonic
+
+    _TICKS_PERIOD = 1 << 30
+    _TICKS_MAX = _TICKS_PERIOD - 1
+    _TICKS_HALF = _TICKS_PERIOD // 2
+
+    def ticks_ms():
+        return int(monotonic() * 1000) & _TICKS_MAX
+
+    def ticks_us():
+        return int(monotonic() * 1000000) & _TICKS_MAX
+
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & _TICKS_MAX
+
+    def ticks_diff(ticks1, ticks2):
+        return ((ticks1 - ticks2 + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+class TimerWheel:
+    """
+    This class models a hashed timer wheel for lease expiry
+
+    Each slot covers resolution_ms. Keys are fired no earlier than their
+    timeout and at most one resolution late. Only tick differences are used,
+    so the wheel is safe across ticks_ms wraparound.
+
+    Keys are ints in [0, capacity), the lease table slots. Each wheel slot is
+    a doubly linked list threaded through per key columns, all allocated up
+    front, so the wheel never grows past footprint() bytes.
+    """
+
+    NONE = 0xFFFF  # end of list, or a key that is not scheduled
+
+    def __init__(
+        self,
+        slots: int = 64,
+        resolution_ms: int = 1000,
+        now: int = None,
+        capacity: int = 128,
+    ):
+        if not 0 < slots < self.NONE or not 0 < capacity < self.NONE:
+            raise ValueError("Timer wheel size out of range")
+
+        self.heads = array("H", [self.NONE] * slots)  # first key in each slot
+        self.next = array("H", [self.NONE] * capacity)
+        self.prev = array("H", [self.NONE] * capacity)
+        self.buckets = array("H", [self.NONE] * capacity)  # key -> slot
+        self.rounds = array("I", bytearray(4 * capacity))  # key -> remaining rounds
+        self.count: int = 0
+
+        self.resolution: int = resolution_ms
+        self.cursor: int = 0
+        self.last: int = ticks_ms() if now is None else now
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key: int):
+        return 0 <= key < len(self.buckets) and self.buckets[key] != self.NONE
+
+    def footprint(self):
+        """
+        Bytes held by the wheel slots and key columns
+        """
+        columns = 2 * (len(self.next) + len(self.prev) + len(self.buckets))
+        return 2 * len(self.heads) + columns + 4 * len(self.rounds)
+
+    def schedule(self, key: int, timeout_ms: int):
+        """
+        (Re)arms key to fire after timeout_ms
+        """
+        self.cancel(key)
+
+        # One extra step as the current slot is already partially elapsed
+        steps = (timeout_ms + self.resolution - 1) // self.resolution + 1
+        rounds, offset = divmod(steps - 1, len(self.heads))
+        slot = (self.cursor + offset + 1) % len(self.heads)
+
+        head = self.heads[slot]
+        self.next[key] = head
+        self.prev[key] = self.NONE
+        if head != self.NONE:
+            self.prev[head] = key
+        self.heads[slot] = key
+        self.buckets[key] = slot
+        self.rounds[key] = rounds
+        self.count += 1
+
+    def cancel(self, key: int):
+        slot = self.buckets[key]
+        if slot == self.NONE:
+            return
+
+        next_key = self.next[key]
+        prev_key = self.prev[key]
+        if prev_key == self.NONE:
+            self.heads[slot] = next_key
+        else:
+            self.next[prev_key] = next_key
+        if next_key != self.NONE:
+            self.prev[next_key] = prev_key
+        self.buckets[key] = self.NONE
+        self.count -= 1
+
+    def advance(self, now: int = None):
+        """
+        Moves the wheel forward to now and returns the keys that expired
+        """
+        if now is None:
+            now = ticks_ms()
+
+        expired = []
+        while ticks_diff(now, self.last) >= self.resolution:
+            self.last = ticks_add(self.last, self.resolution)
+            self.cursor = (self.cursor + 1) % len(self.heads)
+
+            key = self.heads[self.cursor]
+            while key != self.NONE:
+                next_key = self.next[key]
+                if self.rounds[key]:
+                    self.rounds[key] -= 1
+                else:
+                    self.cancel(key)
+                    expired.append(key)
+                key = next_key
+
+        return expired
+
+
+class LeaseTable:
+    """
+    This class models the lease table as fixed size columns
+
+    Slot i holds one lease: the client key in keys, its length in key_lengths
+    (0 for a free slot), its hash in hashes, the address in ips and whether it
+    was only offered or acked in states. A linear probing index maps client
+    keys to slots. Everything is allocated up front,
+    so the table never grows past footprint() bytes. Expiry lives in a
+    TimerWheel of the same capacity, reported by its own footprint().
+    """
+
+    # Longest client key stored. Longer client identifiers cannot be leased.
+    KEY_SIZE = 20
+    HASH_MASK = 0x3FFFFFFF  # keeps hashes small ints on 32 bit ports
+
+    # Lease states
+    FREE = 0
+    OFFERED = 1  # held for a client until it sends its REQUEST
+    BOUND = 2  # acked
+
+    def __init__(self, capacity: int = 128):
+        if not 0 < capacity < 0xFFFF:
+            raise ValueError("Lease table capacity out of range")
+
+        self.capacity: int = capacity
+        self.keys = bytearray(capacity * self.KEY_SIZE)
+        self.key_lengths = bytearray(capacity)
+        self.hashes = array("I", bytearray(4 * capacity))
+        self.ips = array("I", bytearray(4 * capacity))
+        self.states = bytearray(capacity)
+
+        # Stack of free slots, the lowest slot on top
+        self.unused = array("H", range(capacity - 1, -1, -1))
+        self.free: int = capacity
+
+        # Open addressing index at most half full. Entries are slot + 1, 0 is empty.
+        size = 1
+        while size < 2 * capacity:
+            size <<= 1
+        self.index = array("H", bytearray(2 * size))
+        self.mask: int = size - 1
+
+    def __len__(self):
+        return self.capacity - self.free
+
+    def footprint(self):
+        """
+        Bytes held by the table columns and index
+        """
+        columns = len(self.keys) + len(self.key_lengths) + len(self.states)
+        columns += 4 * (len(self.hashes) + len(self.ips))
+        return columns + 2 * (len(self.unused) + len(self.index))
+
+    def find(self, key):
+        """
+        Returns the slot leased to key, or None
+        """
+        length = len(key)
+        if not 0 < length <= self.KEY_SIZE:
+            return None
+
+        key_hash = hash(key) & self.HASH_MASK
+        position = key_hash & self.mask
+        while True:
+            entry = self.index[position]
+            if not entry:
+                return None
+            slot = entry - 1
+            if self.hashes[slot] == key_hash and self.key_lengths[slot] == length:
+                start = slot * self.KEY_SIZE
+                if self.keys[start : start + length] == key:
+                    return slot
+            position = (position + 1) & self.mask
+
+    def add(self, key, ip: int, state: int = BOUND):
+        """
+        Leases ip to key in state and returns its slot. Returns None when the
+        table is full or the key is empty or longer than KEY_SIZE.
+        """
+        length = len(key)
+        if not self.free or not 0 < length <= self.KEY_SIZE:
+            return None
+
+        slot = self.find(key)
+        if slot is None:
+            self.free -= 1
+            slot = self.unused[self.free]
+            key_hash = hash(key) & self.HASH_MASK
+            self.keys[slot * self.KEY_SIZE : slot * self.KEY_SIZE + length] = key
+            self.key_lengths[slot] = length
+            self.hashes[slot] = key_hash
+
+            position = key_hash & self.mask
+            while self.index[position]:
+                position = (position + 1) & self.mask
+            self.index[position] = slot + 1
+
+        self.ips[slot] = ip
+        self.states[slot] = state
+        return slot
+
+    def remove(self, slot: int):
+        """
+        Frees slot. Returns False if it was not in use.
+        """
+        if not self.key_lengths[slot]:
+            return False
+
+        mask = self.mask
+        position = self.hashes[slot] & mask
+        while self.index[position] != slot + 1:
+            position = (position + 1) & mask
+
+        # Backward shift deletion, so lookups never need tombstones
+        hole = position
+        while True:
+            position = (position + 1) & mask
+            entry = self.index[position]
+            if not entry:
+                break
+            # The entry stays unless the hole lies between its home and it
+            home = self.hashes[entry - 1] & mask
+            if hole <= position:
+                stays = hole < home <= position
+            else:
+                stays = hole < home or home <= position
+            if not stays:
+                self.index[hole] = entry
+                hole = position
+        self.index[hole] = 0
+
+        self.key_lengths[slot] = 0
+        self.ips[slot] = 0
+        self.states[slot] = self.FREE
+        self.unused[self.free] = slot
+        self.free += 1
+        return True
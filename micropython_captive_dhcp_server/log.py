@@ -0,0 +1,279 @@
+import struct
+
+try:
+    from micropython_captive_dhcp_server.lease import ticks_ms, ticks_diff
+except Exception:
+    from lease import ticks_ms, ticks_diff
+
+
+class Logger:
+    """
+    This class models a leveled logger with per category enable flags
+
+    A record is a str.format message and its arguments. They are handed to
+    the sink as is, so nothing is formatted unless the sink prints it.
+    Callers guard arguments that are costly to build with enabled().
+    """
+
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+    OFF = 100
+    LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+    # Categories, as bit flags
+    PACKET = 1  # datagrams and decoded packets
+    LEASE = 2  # address allocation and expiry
+    SERVER = 4  # socket and server lifecycle
+    MEMORY = 8  # garbage collection
+    ALL = 0xFF
+
+    def __init__(self, level: int = INFO, categories: int = ALL, sink=None):
+        self.level: int = level
+        self.categories: int = categories
+        self.sink = ConsoleSink() if sink is None else sink
+
+    def enabled(self, level: int, category: int):
+        return level >= self.level and bool(category & self.categories)
+
+    def enable(self, category: int):
+        self.categories |= category
+
+    def disable(self, category: int):
+        self.categories &= ~category
+
+    def log(self, level: int, category: int, message: str, *args):
+        if level >= self.level and category & self.categories:
+            self.sink.write(level, category, message, args)
+
+    def debug(self, category: int, message: str, *args):
+        if self.DEBUG >= self.level and category & self.categories:
+            self.sink.write(self.DEBUG, category, message, args)
+
+    def info(self, category: int, message: str, *args):
+        if self.INFO >= self.level and category & self.categories:
+            self.sink.write(self.INFO, category, message, args)
+
+    def warning(self, category: int, message: str, *args):
+        if self.WARNING >= self.level and category & self.categories:
+            self.sink.write(self.WARNING, category, message, args)
+
+    def error(self, category: int, message: str, *args):
+        if self.ERROR >= self.level and category & self.categories:
+            self.sink.write(self.ERROR, category, message, args)
+
+
+class ErrorCounter:
+    """
+    This class models per kind counts of failed transactions
+
+    A kind is an exception type name, or a name given by the caller for
+    failures that raise nothing, such as an exhausted pool. Every failure is
+    counted, but each kind is logged at most once every interval_ms so a
+    flood of bad packets cannot flood the sink. The logged count tells how
+    many were skipped since.
+    """
+
+    def __init__(self, log: Logger, interval_ms: int = 10000):
+        self.log = log
+        self.interval_ms: int = interval_ms
+        self.counts: dict = {}  # kind -> failures
+        self.last_logged: dict = {}  # kind -> ticks_ms
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def record(self, error: Exception, now: int = None):
+        """
+        Counts error under its exception type. Returns True if it was logged.
+        """
+        return self.count(
+            type(error).__name__, Logger.ERROR, Logger.SERVER, error, now
+        )
+
+    def count(
+        self,
+        name: str,
+        level: int = Logger.WARNING,
+        category: int = Logger.SERVER,
+        detail=None,
+        now: int = None,
+    ):
+        """
+        Counts a failure of kind name. Returns True if it was logged.
+        """
+        count = self.counts.get(name, 0) + 1
+        self.counts[name] = count
+
+        if not self.log.enabled(level, category):
+            return False
+        if now is None:
+            now = ticks_ms()
+        last = self.last_logged.get(name)
+        if last is not None and ticks_diff(now, last) < self.interval_ms:
+            return False
+
+        self.last_logged[name] = now
+        if detail is None:
+            self.log.log(level, category, "{} #{}", name, count)
+        else:
+            self.log.log(level, category, "{} #{} {}", name, count, detail)
+        return True
+
+    def __str__(self):
+        return ", ".join(
+            ["{} {}".format(count, name) for name, count in self.counts.items()]
+        )
+
+
+class ConsoleSink:
+    """
+    This class models a sink printing each record as it is written
+    """
+
+    def write(self, level: int, category: int, message: str, args):
+        print(message.format(*args))
+
+
+class RingSink:
+    """
+    This class models an in RAM ring buffer of the last records
+
+    Records are kept unformatted and only formatted by lines(). Arguments
+    other than ints, strings and bytes are copied or converted with str() on
+    write, since the server reuses buffers and packets.
+    """
+
+    def __init__(self, size: int = 64):
+        self.records = [None] * size
+        self.position: int = 0
+        self.count: int = 0
+
+    def __len__(self):
+        return self.count
+
+    def write(self, level: int, category: int, message: str, args):
+        if args:
+            args = tuple([self.freeze(arg) for arg in args])
+
+        self.records[self.position] = (ticks_ms(), level, category, message, args)
+        self.position = (self.position + 1) % len(self.records)
+        self.count = min(self.count + 1, len(self.records))
+
+    @staticmethod
+    def freeze(arg):
+        if isinstance(arg, (int, str, bytes)):
+            return arg
+        if isinstance(arg, (bytearray, memoryview)):
+            return bytes(arg)
+        # Packets and other objects are reset and reused once handled
+        return str(arg)
+
+    def lines(self):
+        """
+        Returns the buffered records formatted, oldest first
+        """
+        size = len(self.records)
+        lines = []
+        for i in range(self.position - self.count, self.position):
+            ticks, level, category, message, args = self.records[i % size]
+            lines.append(
+                "{} {} {}".format(
+                    ticks, Logger.LEVEL_NAMES.get(level, level), message.format(*args)
+                )
+            )
+        return lines
+
+    def clear(self):
+        self.records = [None] * len(self.records)
+        self.position = 0
+        self.count = 0
+
+
+class BinarySink:
+    """
+    This class models a sink writing compact binary records to a stream
+
+    Each record is a fixed RECORD_FORMAT header (ticks, level, category,
+    message length, argument count), the message and the arguments. Ints
+    that fit in 32 unsigned bits are tagged i and packed, buffers are tagged b
+    and written raw, anything else is tagged s and written as its str().
+    decode() reads the records back.
+    """
+
+    RECORD_FORMAT = ">IBBHB"
+    INT_FORMAT = ">I"
+    LENGTH_FORMAT = ">H"
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.header = bytearray(struct.calcsize(self.RECORD_FORMAT))
+        self.field = bytearray(5)  # tag and packed int or length
+
+    def write(self, level: int, category: int, message: str, args):
+        message = message.encode()
+        struct.pack_into(
+            self.RECORD_FORMAT,
+            self.header,
+            0,
+            ticks_ms(),
+            level,
+            category,
+            len(message),
+            len(args),
+        )
+        self.stream.write(self.header)
+        self.stream.write(message)
+
+        for arg in args:
+            if isinstance(arg, int) and 0 <= arg <= 0xFFFFFFFF:
+                self.field[0] = ord("i")
+                struct.pack_into(self.INT_FORMAT, self.field, 1, arg)
+                self.stream.write(self.field)
+                continue
+
+            if not isinstance(arg, (bytes, bytearray, memoryview)):
+                arg = str(arg).encode()
+                self.field[0] = ord("s")
+            else:
+                self.field[0] = ord("b")
+            struct.pack_into(self.LENGTH_FORMAT, self.field, 1, len(arg))
+            self.stream.write(memoryview(self.field)[:3])
+            self.stream.write(arg)
+
+    @staticmethod
+    def decode(data):
+        """
+        Returns the records in data as (ticks, level, category, message, args)
+        """
+        records = []
+        position = 0
+        header_size = struct.calcsize(BinarySink.RECORD_FORMAT)
+        while position + header_size <= len(data):
+            ticks, level, category, length, count = struct.unpack_from(
+                BinarySink.RECORD_FORMAT, data, position
+            )
+            position += header_size
+            message = bytes(data[position : position + length]).decode()
+            position += length
+
+            args = []
+            for _ in range(count):
+                tag = data[position]
+                if tag == ord("i"):
+                    args.append(
+                        struct.unpack_from(BinarySink.INT_FORMAT, data, position + 1)[0]
+                    )
+                    position += 5
+                    continue
+
+                length = struct.unpack_from(
+                    BinarySink.LENGTH_FORMAT, data, position + 1
+                )[0]
+                value = bytes(data[position + 3 : position + 3 + length])
+                args.append(value.decode() if tag == ord("s") else value)
+                position += 3 + length
+
+            records.append((ticks, level, category, message, tuple(args)))
+        return records
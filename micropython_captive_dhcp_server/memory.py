@@ -0,0 +1,119 @@
+import gc
+
+try:
+    from micropython_captive_dhcp_server.lease import (
+        ticks_ms,
+        ticks_us,
+        ticks_add,
+        ticks_diff,
+    )
+except Exception:
+    from lease import ticks_ms, ticks_us, ticks_add, ticks_diff
+
+
+class GcPolicy:
+    """
+    This class models when the server collects garbage
+
+    Instead of collecting on every loop iteration, a collection runs after a
+    burst of packets only when free memory is below watermark, or once the
+    socket has been quiet for idle_ms and at least idle_garbage bytes were
+    allocated since the last collection. Without gc.mem_free and
+    gc.mem_alloc (CPython) it never collects and leaves it to the runtime.
+
+    gc.mem_free walks the whole heap, so free memory is checked at most once
+    every check_ms.
+    """
+
+    WATERMARK = 1
+    IDLE = 2
+
+    def __init__(
+        self,
+        watermark: int = 16384,
+        idle_ms: int = 1000,
+        idle_garbage: int = 4096,
+        check_ms: int = 250,
+        now: int = None,
+    ):
+        self.watermark: int = watermark
+        self.idle_ms: int = idle_ms
+        self.idle_garbage: int = idle_garbage
+        self.check_ms: int = check_ms
+
+        self.last_activity: int = ticks_ms() if now is None else now
+        self.last_check: int = ticks_add(self.last_activity, -check_ms)
+        self.baseline: int = self.mem_alloc()  # allocated after the last collection
+
+        self.collections: int = 0
+        self.watermark_collections: int = 0
+        self.idle_collections: int = 0
+        self.total_us: int = 0
+        self.max_us: int = 0
+        self.last_us: int = 0
+
+    def mem_free(self):
+        return gc.mem_free() if hasattr(gc, "mem_free") else None
+
+    def mem_alloc(self):
+        return gc.mem_alloc() if hasattr(gc, "mem_alloc") else 0
+
+    def after_burst(self, now: int = None):
+        """
+        Called once a burst of packets is handled. Collects if memory is low.
+        """
+        if now is None:
+            now = ticks_ms()
+        self.last_activity = now
+        if ticks_diff(now, self.last_check) < self.check_ms:
+            return False
+
+        self.last_check = now
+        free = self.mem_free()
+        if free is None or free >= self.watermark:
+            return False
+        # Live data alone may keep free memory under the watermark
+        if self.mem_alloc() > self.baseline:
+            self.collect(self.WATERMARK)
+            return True
+        return False
+
+    def on_idle(self, now: int = None):
+        """
+        Called periodically. Collects if the socket has been quiet long enough
+        and there is garbage worth collecting.
+        """
+        if now is None:
+            now = ticks_ms()
+        if ticks_diff(now, self.last_activity) < self.idle_ms:
+            return False
+        if self.mem_alloc() - self.baseline < self.idle_garbage:
+            return False
+
+        self.collect(self.IDLE)
+        return True
+
+    def collect(self, reason: int = IDLE):
+        start = ticks_us()
+        gc.collect()
+        elapsed = ticks_diff(ticks_us(), start)
+
+        self.baseline = self.mem_alloc()
+        self.collections += 1
+        if reason == self.WATERMARK:
+            self.watermark_collections += 1
+        else:
+            self.idle_collections += 1
+        self.total_us += elapsed
+        self.max_us = max(self.max_us, elapsed)
+        self.last_us = elapsed
+        return elapsed
+
+    def __str__(self):
+        return "{} collections ({} watermark, {} idle), {} us total, {} us max".format(
+            self.collections,
+            self.watermark_collections,
+            self.idle_collections,
+            self.total_us,
+            self.max_us,
+        )
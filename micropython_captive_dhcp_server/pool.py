@@ -0,0 +1,92 @@
+class AddressPool:
+    """
+    This class models a pool of client addresses backed by a bitmap
+
+    One bit per address in [start, end]. The network address, the broadcast
+    address and the server's own address are never handed out.
+    """
+
+    def __init__(self, start: int, end: int, netmask: int, server_ip: int = 0):
+        network = start & netmask
+        broadcast = network | (~netmask & 0xFFFFFFFF)
+
+        self.start: int = max(start, network + 1)
+        self.end: int = min(end, broadcast - 1)
+        self.size: int = self.end - self.start + 1
+        if self.size <= 0:
+            raise ValueError("Empty address pool")
+
+        self.bitmap = bytearray((self.size + 7) // 8)
+        self.cursor: int = 0  # next-fit byte index into the bitmap
+        self.free: int = self.size
+
+        # Pad bits past the end of the range are permanently in use
+        for offset in range(self.size, len(self.bitmap) * 8):
+            self.bitmap[offset >> 3] |= 1 << (offset & 7)
+
+        if server_ip in self:
+            self.reserve(server_ip)
+
+    @staticmethod
+    def from_subnet(server_ip: int, netmask: int):
+        network = server_ip & netmask
+        broadcast = network | (~netmask & 0xFFFFFFFF)
+        return AddressPool(network + 1, broadcast - 1, netmask, server_ip)
+
+    def __contains__(self, ip: int):
+        return self.start <= ip <= self.end
+
+    def __len__(self):
+        return self.size
+
+    def in_use(self, ip: int):
+        offset = ip - self.start
+        return bool(self.bitmap[offset >> 3] & (1 << (offset & 7)))
+
+    def allocate(self):
+        """
+        Returns the next free address, or None when the pool is exhausted
+        """
+        if not self.free:
+            return None
+
+        bitmap = self.bitmap
+        i = self.cursor
+        while bitmap[i] == 0xFF:
+            i += 1
+            if i == len(bitmap):
+                i = 0
+
+        byte = bitmap[i]
+        bit = 0
+        while byte & (1 << bit):
+            bit += 1
+
+        bitmap[i] = byte | (1 << bit)
+        self.cursor = i
+        self.free -= 1
+        return self.start + (i << 3) + bit
+
+    def reserve(self, ip: int):
+        """
+        Marks a specific address as used. Returns False if it was taken.
+        """
+        if ip not in self or self.in_use(ip):
+            return False
+
+        offset = ip - self.start
+        self.bitmap[offset >> 3] |= 1 << (offset & 7)
+        self.free -= 1
+        return True
+
+    def release(self, ip: int):
+        """
+        Returns an address to the pool. Returns False if it was not in use.
+        """
+        if ip not in self or not self.in_use(ip):
+            return False
+
+        offset = ip - self.start
+        self.bitmap[offset >> 3] &= ~(1 << (offset & 7)) & 0xFF
+        self.free += 1
+        return True
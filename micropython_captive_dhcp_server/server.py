@@ -1,5 +1,6 @@
 import usocket as socket
 import uasyncio as asyncio
+from uasyncio import core
 
 try:
     from micropython_captive_dhcp_server.packet import (
@@ -9,55 +10,324 @@ try:
         DhcpOffer,
         DhcpAck,
         Ip,
+        DhcpOptions,
+        PacketPool,
+        Prefilter,
     )
+    from micropython_captive_dhcp_server.pool import AddressPool
+    from micropython_captive_dhcp_server.lease import TimerWheel, LeaseTable
+    from micropython_captive_dhcp_server.log import Logger, ErrorCounter
+    from micropython_captive_dhcp_server.memory import GcPolicy
+    from micropython_captive_dhcp_server.cache import ReplyCache
 except Exception:
-    from packet import Header, DhcpDiscover, DhcpRequest, DhcpOffer, DhcpAck, Ip
+    from packet import (
+        Header,
+        DhcpDiscover,
+        DhcpRequest,
+        DhcpOffer,
+        DhcpAck,
+        Ip,
+        DhcpOptions,
+        PacketPool,
+        Prefilter,
+    )
+    from pool import AddressPool
+    from lease import TimerWheel, LeaseTable
+    from log import Logger, ErrorCounter
+    from memory import GcPolicy
+    from cache import ReplyCache
 import gc
 import time
 
 
 class CaptiveDhcpServer:
-    def __init__(self):
-        self.ips = {}
-        self.macs = {}
+    LEASE_TIME = 86400  # seconds, as advertised in OFFER and ACK
+    OFFER_HOLD = 30  # seconds an offered address waits for the REQUEST
+    EXPIRY_SLOTS = 64
+    EXPIRY_RESOLUTION = 5000  # ms, leases expire at most this late
+
+    def __init__(
+        self,
+        trim_options: bool = False,
+        max_leases: int = 128,
+        log: Logger = None,
+        memory: GcPolicy = None,
+        replies: ReplyCache = None,
+    ):
+        self.log = Logger() if log is None else log
+        self.memory = GcPolicy() if memory is None else memory
+        # Failed transactions, by exception type
+        self.errors = ErrorCounter(self.log)
+        # Only send the required options plus those the client asked for
+        self.trim_options = trim_options
+        # client key (client identifier or 6 octet hardware address) -> ip
+        self.leases = LeaseTable(max_leases)
+        self.pool = None
+        self.offer_template = None
+        self.ack_template = None
+        self.prefilter = Prefilter()
+        self.packets = PacketPool()
+        # Replies recently sent, answering retransmits without a parse
+        self.replies = ReplyCache() if replies is None else replies
+        # Keyed by lease table slot
+        self.expiry = TimerWheel(
+            self.EXPIRY_SLOTS, self.EXPIRY_RESOLUTION, capacity=max_leases
+        )
+        self.sock = None
+        self.broadcast_addr = None
+
+    def get_free_ip(self, key):
+        if not self.leases.free:
+            return None
+        ip = self.pool.allocate()
+        if ip is None:
+            return None
+        return self.add_lease(key, ip, LeaseTable.OFFERED)
+
+    def add_lease(self, key, ip: int, state: int):
+        """
+        Records ip, taken from the pool, as leased to key in state. Gives ip
+        back to the pool and returns None if the table is full or cannot store
+        key.
+        """
+        slot = self.leases.add(key, ip, state)
+        if slot is None:
+            self.pool.release(ip)
+            return None
+        self.arm_lease(slot)
+        return ip
+
+    def arm_lease(self, slot: int):
+        """
+        (Re)schedules the expiry of slot. Offers are only held for OFFER_HOLD,
+        so clients that never send a REQUEST do not keep an address for a day.
+        """
+        if self.leases.states[slot] == LeaseTable.OFFERED:
+            self.expiry.schedule(slot, self.OFFER_HOLD * 1000)
+        else:
+            self.expiry.schedule(slot, self.LEASE_TIME * 1000)
+
+    def find_lease(self, mac: bytes, client_id=None):
+        slot = None
+        if client_id is not None:
+            slot = self.leases.find(client_id)
+        if slot is None:
+            slot = self.leases.find(mac)
+        return slot
 
-    def get_free_ip(self, server_ip: str, mac: str):
-        next_ip = Ip.next_ip(server_ip)
-        while next_ip in self.ips:
-            next_ip = Ip.next_ip(next_ip)
+    def get_client_ip(self, mac: bytes, client_id=None):
+        slot = self.find_lease(mac, client_id)
+        if slot is None:
+            return self.get_free_ip(mac if client_id is None else client_id)
 
-        self.ips[next_ip] = int(time.time())
-        self.macs[mac] = next_ip
+        self.arm_lease(slot)
+        return self.leases.ips[slot]
 
-        return next_ip
+    def renew_lease(self, mac: bytes, client_id=None):
+        slot = self.find_lease(mac, client_id)
+        if slot is not None:
+            self.leases.states[slot] = LeaseTable.BOUND
+            self.arm_lease(slot)
+        return slot
+
+    def release_lease(self, slot: int):
+        self.expiry.cancel(slot)
+        self.pool.release(self.leases.ips[slot])
+        self.leases.remove(slot)
+
+    async def expire_leases(self):
+        while True:
+            await asyncio.sleep_ms(self.expiry.resolution)
+            try:
+                for slot in self.expiry.advance():
+                    if self.log.enabled(Logger.INFO, Logger.LEASE):
+                        ip = Ip.int_to_str(self.leases.ips[slot])
+                        if self.leases.states[slot] == LeaseTable.OFFERED:
+                            self.log.info(Logger.LEASE, "Offer expired: {}", ip)
+                        else:
+                            self.log.info(Logger.LEASE, "Lease expired: {}", ip)
+                    self.release_lease(slot)
+            except Exception as e:
+                # Keep expiring the other leases
+                self.errors.record(e)
+
+    async def collect_garbage(self):
+        while True:
+            await asyncio.sleep_ms(self.memory.idle_ms)
+            if self.memory.on_idle():
+                self.log_collection("idle")
+
+    def log_collection(self, reason: str):
+        if self.log.enabled(Logger.DEBUG, Logger.MEMORY):
+            self.log.debug(
+                Logger.MEMORY,
+                "GC ({}) took {} us, {} bytes free. {}",
+                reason,
+                self.memory.last_us,
+                self.memory.mem_free(),
+                self.memory,
+            )
 
     def send_broadcast_reply(self, reply):
-        udpb = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            udpb.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-            # As of micropython 1.20.0, SO_BROADCAST is not defined.
-            # Using defined value of 0x20
-            # see: https://github.com/micropython/micropython/issues/8729
-            # udpb.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            udpb.setsockopt(socket.SOL_SOCKET, 0x20, 1)
-
-            udpb.setblocking(False)
-            broadcast_addr = socket.getaddrinfo(
-                "255.255.255.255", 68, socket.AF_INET, socket.SOCK_DGRAM
-            )[0][4]
-            print(f"Broadcasting Response: {reply}")
-            udpb.sendto(reply, broadcast_addr)
+            if self.log.enabled(Logger.DEBUG, Logger.PACKET):
+                self.log.debug(
+                    Logger.PACKET, "Broadcasting Response: {}", bytes(reply)
+                )
+            self.sock.sendto(reply, self.broadcast_addr)
         except Exception as e:
-            print(f"Failed to broadcast reply {e}")
+            # ENOMEM or EAGAIN come in bursts, count them and log a few
+            self.errors.record(e)
+
+    def configure(self, server_ip: str, netmask: str):
+        self.pool = AddressPool.from_subnet(
+            Ip.str_to_int(server_ip), Ip.str_to_int(netmask)
+        )
+        self.offer_template = DhcpOffer.template(server_ip, netmask)
+        self.ack_template = DhcpAck.template(server_ip, netmask)
+        self.log.info(
+            Logger.LEASE,
+            "Lease table: {} leases in {} bytes, expiry in {} bytes",
+            self.leases.capacity,
+            self.leases.footprint(),
+            self.expiry.footprint(),
+        )
+
+    def requested_options(self, header: Header):
+        if not self.trim_options:
+            return None
+        return header.options.get(DhcpOptions.PARAM_REQUEST_LIST)
+
+    def client_id(self, header: Header):
+        client_id = header.options.get(DhcpOptions.CLIENT_ID)
+        # Empty or too long to store, such clients are leased by hardware
+        # address
+        if client_id is not None and not 0 < len(client_id) <= LeaseTable.KEY_SIZE:
+            return None
+        return client_id
+
+    def requested_ip(self, header: Header, key, slot: int = None):
+        """
+        Returns the address to ack a REQUEST with, or None to not ack it.
+
+        A client holding a lease (slot) gets its leased address. Otherwise the
+        address it asks for, option 50 when rebooting or ciaddr when renewing,
+        is leased to key if it is free in the pool.
+        """
+        if slot is not None:
+            return self.leases.ips[slot]
+
+        ip = header.options.get(DhcpOptions.REQUESTED_IP)
+        # A malformed option 50 decodes to a list or bytes
+        if not isinstance(ip, int):
+            ip = header.ciaddr
+        if not ip or not self.leases.free or not self.pool.reserve(ip):
+            return None
+        return self.add_lease(key, ip, LeaseTable.BOUND)
+
+    def handle(self, data):
+        if self.log.enabled(Logger.DEBUG, Logger.PACKET):
+            self.log.debug(Logger.PACKET, "Incoming data: {}", data)
+
+        if not self.prefilter.accept(data):
+            if self.log.enabled(Logger.DEBUG, Logger.PACKET):
+                reason = Prefilter.REASONS[self.prefilter.check(data)]
+                self.log.debug(Logger.PACKET, "Dropped datagram: {}", reason)
+            return
+
+        request = None
+        try:
+            slot = self.replies.find(data)
+            if slot is not None:
+                if self.replies.policy == ReplyCache.REPLAY:
+                    self.log.debug(Logger.PACKET, "Retransmit, answered from cache")
+                    self.send_broadcast_reply(self.replies.reply(slot))
+                else:
+                    self.log.debug(Logger.PACKET, "Retransmit, dropped")
+                return
+
+            request = self.packets.parse(data)
+            self.reply(request, data)
+        except Exception as e:
+            # Only this transaction fails, the next datagram is handled as usual
+            self.errors.record(e)
         finally:
-            udpb.close()
+            self.packets.release(request)
+
+    def reply(self, request, data):
+        if request is None:
+            # Past the prefilter, only a malformed option list is left
+            self.prefilter.reject(Prefilter.MALFORMED)
+            self.log.debug(Logger.PACKET, "Dropped datagram: malformed")
+            return
+        if self.log.enabled(Logger.DEBUG, Logger.PACKET):
+            self.log.debug(Logger.PACKET, "{}", request)
+
+        if isinstance(request, DhcpDiscover):
+            self.log.debug(Logger.PACKET, "Creating Offer for Discover")
+            client_ip = self.get_client_ip(
+                request.header.hwaddr,
+                self.client_id(request.header),
+            )
+            if client_ip is None:
+                self.errors.count(
+                    "Address pool or lease table exhausted",
+                    Logger.WARNING,
+                    Logger.LEASE,
+                )
+                return
+            if self.log.enabled(Logger.INFO, Logger.LEASE):
+                self.log.info(Logger.LEASE, "Offering {}", Ip.int_to_str(client_ip))
+            reply = self.offer_template.reply_to(
+                data,
+                client_ip,
+                self.requested_options(request.header),
+                request.header.options.get(DhcpOptions.MAX_MESSAGE_SIZE),
+            )
+
+            self.send_broadcast_reply(reply)
+            self.replies.store(data, reply)
+
+        elif isinstance(request, DhcpRequest):
+            self.log.debug(Logger.PACKET, "Creating Ack for Request")
+            mac = request.header.hwaddr
+            client_id = self.client_id(request.header)
+            slot = self.renew_lease(mac, client_id)
+            client_ip = self.requested_ip(
+                request.header, mac if client_id is None else client_id, slot
+            )
+            if client_ip is None:
+                self.errors.count(
+                    "Request without an address to ack", Logger.WARNING, Logger.LEASE
+                )
+                return
+            reply = self.ack_template.reply_to(
+                data,
+                client_ip,
+                self.requested_options(request.header),
+                request.header.options.get(DhcpOptions.MAX_MESSAGE_SIZE),
+            )
+
+            self.send_broadcast_reply(reply)
+            self.replies.store(data, reply)
 
     async def run(self, server_ip: str, netmask: str):
+        self.configure(server_ip, netmask)
+
         udps = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         udps.setblocking(False)
         udps.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
+        # Replies are broadcast from the bound port 67 socket itself.
+        # As of micropython 1.20.0, SO_BROADCAST is not defined on every port.
+        # Falling back to the lwIP value of 0x20
+        # see: https://github.com/micropython/micropython/issues/8729
+        udps.setsockopt(socket.SOL_SOCKET, getattr(socket, "SO_BROADCAST", 0x20), 1)
+        self.sock = udps
+        self.broadcast_addr = socket.getaddrinfo(
+            "255.255.255.255", 68, socket.AF_INET, socket.SOCK_DGRAM
+        )[0][4]
+
         bound = False
         while not bound:
             try:
@@ -66,48 +336,36 @@ class CaptiveDhcpServer:
                     "0.0.0.0", 67, socket.AF_INET, socket.SOCK_DGRAM
                 )[0][-1]
                 udps.bind(addr)
-                print("Starting server on port 67")
+                self.log.info(Logger.SERVER, "Starting server on port 67")
                 bound = True
             except Exception as e:
-                print(f"Failed to bind to port {e}")
+                self.log.error(Logger.SERVER, "Failed to bind to port {}", e)
                 time.sleep(0.5)
 
+        asyncio.create_task(self.expire_leases())
+        asyncio.create_task(self.collect_garbage())
+
         while True:
             try:
-                gc.collect()
-
-                data, addr = udps.recvfrom(2048)
-                print("Incoming data...")
-                print(data)
-
-                request = Header.parse(data)
-                print(request)
-
-                if isinstance(request, DhcpDiscover):
-                    print("Creating Offer for Discover")
-                    response = DhcpOffer()
-                    client_ip = self.get_free_ip(server_ip, request.header.chaddr)
-                    print("Found new ip: " + client_ip)
-                    reply = response.answer(request, client_ip, server_ip, netmask)
-                    print(response)
-
-                    self.send_broadcast_reply(reply)
-
-                elif isinstance(request, DhcpRequest):
-                    print("Creating Ack for Request")
-                    response = DhcpAck()
-                    reply = response.answer(request, server_ip, netmask)
-                    print(response)
-
-                    self.send_broadcast_reply(reply)
+                # Sleep until the socket is readable instead of polling it
+                yield core._io_queue.queue_read(udps)
 
-                await asyncio.sleep_ms(100)
+                # Drain every datagram queued since the last wakeup
+                while True:
+                    try:
+                        data, addr = udps.recvfrom(2048)
+                    except OSError:
+                        break
+                    self.handle(data)
 
-            except OSError:
-                await asyncio.sleep_ms(500)
+                # Between bursts, and only when memory runs low
+                if self.memory.after_burst():
+                    self.log_collection("watermark")
 
             except Exception as e:
-                print(f"Exception {e}")
-                await asyncio.sleep_ms(500)
+                # Packets are isolated in handle(), this is the loop itself.
+                # Yield once rather than stall every client.
+                self.errors.record(e)
+                await asyncio.sleep_ms(0)
 
         udps.close()
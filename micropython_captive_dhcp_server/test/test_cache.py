@@ -0,0 +1,68 @@
+import unittest
+from ..cache import ReplyCache
+from . import test_packet
+
+
+class TestReplyCache(unittest.TestCase):
+    discover = test_packet.TestHeader.discover_linux
+    request = test_packet.TestHeader.request_linux
+
+    @staticmethod
+    def with_xid(data, xid: int):
+        packet = bytearray(data)
+        packet[4:8] = xid.to_bytes(4, "big")
+        return bytes(packet)
+
+    def test_retransmit(self):
+        cache = ReplyCache(2, 1000)
+
+        self.assertEqual(cache.find(self.discover, 0), None)
+        slot = cache.store(self.discover, b"offer", 0)
+        self.assertEqual(cache.find(self.discover, 500), slot)
+        self.assertEqual(bytes(cache.reply(slot)), b"offer")
+
+        # Same transaction, another message type
+        retransmit = bytearray(self.request)
+        retransmit[4:8] = self.discover[4:8]
+        self.assertEqual(cache.find(retransmit, 500), None)
+
+        # Another client
+        other = bytearray(self.discover)
+        other[33] ^= 1
+        self.assertEqual(cache.find(other, 500), None)
+
+        # Outside the retransmit window the request is handled again
+        self.assertEqual(cache.find(self.discover, 1000), None)
+        self.assertEqual(cache.store(self.discover, b"offer again", 1000), slot)
+        self.assertEqual(bytes(cache.reply(slot)), b"offer again")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(str(cache), "1 hits, 4 misses, 1 of 2 replies cached")
+
+    def test_least_recently_used(self):
+        cache = ReplyCache(2, 1000)
+        first = self.with_xid(self.discover, 1)
+        second = self.with_xid(self.discover, 2)
+        third = self.with_xid(self.discover, 3)
+
+        cache.store(first, b"1", 0)
+        cache.store(second, b"2", 10)
+        cache.find(first, 20)
+        cache.store(third, b"3", 30)
+
+        self.assertEqual(cache.find(second, 40), None)
+        self.assertEqual(bytes(cache.reply(cache.find(first, 40))), b"1")
+        self.assertEqual(bytes(cache.reply(cache.find(third, 40))), b"3")
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.find(first, 40), None)
+
+    def test_disabled(self):
+        cache = ReplyCache(0)
+
+        self.assertEqual(cache.store(self.discover, b"offer"), None)
+        self.assertEqual(cache.find(self.discover), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
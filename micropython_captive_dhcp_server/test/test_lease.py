@@ -0,0 +1,135 @@
+import unittest
+from ..lease import TimerWheel, LeaseTable, ticks_add
+
+
+class TestTimerWheel(unittest.TestCase):
+    def test_expiry(self):
+        wheel = TimerWheel(8, 100, now=0)
+        wheel.schedule(0, 250)
+        wheel.schedule(1, 1000)
+
+        self.assertEqual(wheel.advance(200), [])
+        self.assertEqual(wheel.advance(400), [0])
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(1000), [])
+        self.assertEqual(wheel.advance(1100), [1])
+        self.assertEqual(len(wheel), 0)
+
+    def test_never_fires_early(self):
+        for timeout in range(0, 2000, 37):
+            wheel = TimerWheel(4, 100, now=0)
+            wheel.advance(55)
+            wheel.schedule(0, timeout)
+
+            now = 55
+            while not wheel.advance(now):
+                now += 1
+            self.assertGreaterEqual(now - 55, timeout)
+            self.assertLessEqual(now - 55, timeout + 200)
+
+    def test_reschedule(self):
+        wheel = TimerWheel(8, 100, now=0)
+        wheel.schedule(0, 300)
+        wheel.advance(200)
+        wheel.schedule(0, 300)
+
+        self.assertEqual(wheel.advance(400), [])
+        self.assertEqual(wheel.advance(700), [0])
+
+    def test_cancel(self):
+        wheel = TimerWheel(8, 100, now=0)
+        wheel.schedule(0, 100)
+        wheel.cancel(0)
+        wheel.cancel(1)
+
+        self.assertFalse(0 in wheel)
+        self.assertFalse(1000 in wheel)
+        self.assertEqual(wheel.advance(1000), [])
+
+    def test_same_slot(self):
+        wheel = TimerWheel(8, 100, now=0, capacity=4)
+        for key in range(4):
+            wheel.schedule(key, 300)
+        wheel.cancel(2)
+        wheel.schedule(1, 1100)
+
+        self.assertEqual(sorted(wheel.advance(400)), [0, 3])
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(1200), [1])
+        self.assertEqual(wheel.footprint(), 2 * 8 + 2 * 3 * 4 + 4 * 4)
+
+    def test_wraparound(self):
+        start = ticks_add(0, -150)
+        wheel = TimerWheel(8, 100, now=start)
+        wheel.schedule(0, 300)
+
+        self.assertEqual(wheel.advance(ticks_add(start, 300)), [])
+        self.assertEqual(wheel.advance(ticks_add(start, 400)), [0])
+
+
+class TestLeaseTable(unittest.TestCase):
+    def test_add_find_remove(self):
+        table = LeaseTable(4)
+        mac = b"\x08\x00\x27\x92\x1f\xae"
+        client_id = b"\x01\x08\x00\x27\x92\x1f\xae"
+
+        slot = table.add(mac, 0xC0A80402)
+        self.assertEqual(table.find(mac), slot)
+        self.assertEqual(table.ips[slot], 0xC0A80402)
+        self.assertEqual(table.find(client_id), None)
+        self.assertEqual(table.states[slot], LeaseTable.BOUND)
+        self.assertEqual(table.add(mac, 0xC0A80403, LeaseTable.OFFERED), slot)
+        self.assertEqual(table.ips[slot], 0xC0A80403)
+        self.assertEqual(table.states[slot], LeaseTable.OFFERED)
+        self.assertEqual(len(table), 1)
+
+        self.assertTrue(table.remove(slot))
+        self.assertFalse(table.remove(slot))
+        self.assertEqual(table.states[slot], LeaseTable.FREE)
+        self.assertEqual(table.find(mac), None)
+        self.assertEqual(len(table), 0)
+
+    def test_capacity(self):
+        table = LeaseTable(3)
+        for i in range(3):
+            self.assertEqual(table.add(bytes([i]) * 6, i), i)
+
+        self.assertEqual(table.add(b"\xff" * 6, 1), None)
+        self.assertEqual(table.add(b"\x01" * (LeaseTable.KEY_SIZE + 1), 1), None)
+        self.assertEqual(table.add(b"", 1), None)
+
+        table.remove(1)
+        self.assertEqual(table.add(b"\xff" * 6, 1), 1)
+
+    def test_footprint(self):
+        table = LeaseTable(100)
+
+        # 20 octet key, its length, state, hash, ip, free stack entry, two index
+        # entries
+        self.assertEqual(table.footprint(), 100 * (20 + 1 + 1 + 4 + 4 + 2) + 256 * 2)
+        with self.assertRaises(ValueError):
+            LeaseTable(0)
+
+    def test_matches_dict(self):
+        # Small index so that probe chains collide and wrap around
+        table = LeaseTable(16)
+        model = {}
+        seed = 1
+        for i in range(3000):
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            key = bytes([seed >> 8 & 0x1F]) * (1 + (seed >> 16) % 7)
+            slot = table.find(key)
+            if key in model:
+                self.assertEqual(table.ips[slot], model[key])
+                if seed & 1:
+                    table.remove(slot)
+                    del model[key]
+            else:
+                self.assertEqual(slot, None)
+                if table.add(key, i) is not None:
+                    model[key] = i
+            self.assertEqual(len(table), len(model))
+
+
+if __name__ == "__main__":
+    unittest.main()
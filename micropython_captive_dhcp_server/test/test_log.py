@@ -0,0 +1,117 @@
+import io
+import unittest
+from ..log import Logger, RingSink, BinarySink, ErrorCounter
+from ..packet import PacketPool
+from . import test_packet
+
+
+class Unformattable:
+    def __str__(self):
+        raise AssertionError("formatted a disabled record")
+
+
+class TestLogger(unittest.TestCase):
+    def test_levels_and_categories(self):
+        sink = RingSink(8)
+        log = Logger(Logger.INFO, Logger.LEASE | Logger.SERVER, sink)
+
+        log.debug(Logger.LEASE, "{}", Unformattable())
+        log.info(Logger.PACKET, "{}", Unformattable())
+        log.info(Logger.LEASE, "Offering {}", "192.168.4.2")
+        log.error(Logger.SERVER, "Exception {}", 1)
+
+        self.assertEqual(len(sink), 2)
+        self.assertTrue(log.enabled(Logger.WARNING, Logger.LEASE))
+        self.assertFalse(log.enabled(Logger.DEBUG, Logger.LEASE))
+
+        log.disable(Logger.LEASE)
+        log.enable(Logger.PACKET)
+        log.warning(Logger.LEASE, "{}", Unformattable())
+        log.log(Logger.INFO, Logger.PACKET, "Unknown or missing message type")
+        self.assertEqual(len(sink), 3)
+
+    def test_ring_sink(self):
+        sink = RingSink(3)
+        log = Logger(Logger.DEBUG, Logger.ALL, sink)
+        data = bytearray(b"\x01")
+
+        for i in range(5):
+            log.info(Logger.LEASE, "lease {}", i)
+        log.debug(Logger.PACKET, "data {}", data)
+        data[0] = 2
+
+        lines = sink.lines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].endswith(" INFO lease 3"))
+        self.assertTrue(lines[1].endswith(" INFO lease 4"))
+        self.assertTrue(lines[2].endswith(" DEBUG data b'\\x01'"))
+
+        sink.clear()
+        self.assertEqual(sink.lines(), [])
+
+    def test_ring_sink_pooled_packet(self):
+        sink = RingSink(3)
+        log = Logger(Logger.DEBUG, Logger.ALL, sink)
+        pool = PacketPool(1)
+
+        request = pool.parse(test_packet.TestHeader.request_linux)
+        log.debug(Logger.PACKET, "{}", request)
+        pool.release(request)
+
+        line = sink.lines()[0]
+        self.assertIn('"xid": "0x2ef9317f"', line)
+        self.assertIn('"12": "mario"', line)
+
+    def test_binary_sink(self):
+        stream = io.BytesIO()
+        log = Logger(Logger.DEBUG, Logger.ALL, BinarySink(stream))
+
+        log.debug(Logger.PACKET, "Incoming data: {}", memoryview(b"\x01\x02\x03"))
+        log.info(Logger.LEASE, "Offering {} for {}", 0xC0A80402, 86400)
+        log.error(Logger.SERVER, "Exception {}", ValueError("bad"))
+
+        records = BinarySink.decode(stream.getvalue())
+        self.assertEqual(len(records), 3)
+        self.assertEqual(
+            records[0][1:],
+            (Logger.DEBUG, Logger.PACKET, "Incoming data: {}", (b"\x01\x02\x03",)),
+        )
+        self.assertEqual(
+            records[1][1:],
+            (Logger.INFO, Logger.LEASE, "Offering {} for {}", (0xC0A80402, 86400)),
+        )
+        self.assertEqual(records[2][3:], ("Exception {}", ("bad",)))
+
+
+class TestErrorCounter(unittest.TestCase):
+    def test_rate_limit(self):
+        sink = RingSink(8)
+        errors = ErrorCounter(Logger(Logger.INFO, Logger.ALL, sink), 1000)
+
+        self.assertTrue(errors.record(KeyError(50), 0))
+        self.assertFalse(errors.record(KeyError(50), 500))
+        self.assertTrue(errors.record(ValueError("bad"), 600))
+        self.assertTrue(errors.record(KeyError(50), 1000))
+
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(errors.counts, {"KeyError": 3, "ValueError": 1})
+        self.assertEqual(len(sink), 3)
+        self.assertTrue(sink.lines()[2].endswith(" ERROR KeyError #3 50"))
+
+    def test_count(self):
+        sink = RingSink(8)
+        errors = ErrorCounter(Logger(Logger.INFO, Logger.ALL, sink), 1000)
+
+        warning = (Logger.WARNING, Logger.LEASE)
+        self.assertTrue(errors.count("Pool exhausted", *warning, now=0))
+        self.assertFalse(errors.count("Pool exhausted", *warning, now=10))
+        # Disabled levels are counted, never logged
+        self.assertFalse(errors.count("Retransmit", Logger.DEBUG, Logger.PACKET, now=0))
+
+        self.assertEqual(errors.counts, {"Pool exhausted": 2, "Retransmit": 1})
+        self.assertEqual(len(sink), 1)
+        self.assertTrue(sink.lines()[0].endswith(" WARNING Pool exhausted #1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from ..memory import GcPolicy
+
+
+class FakeHeap(GcPolicy):
+    def __init__(self, *args):
+        self.free = 100000
+        self.allocated = 0
+        super().__init__(*args)
+
+    def mem_free(self):
+        return self.free
+
+    def mem_alloc(self):
+        return self.allocated
+
+
+class TestGcPolicy(unittest.TestCase):
+    def test_watermark(self):
+        policy = FakeHeap(16384, 1000, 4096, 100, 0)
+
+        self.assertFalse(policy.after_burst(0))
+        policy.free = 1000
+        policy.allocated = 50000
+
+        # Free memory is only checked every check_ms
+        self.assertFalse(policy.after_burst(50))
+        self.assertTrue(policy.after_burst(100))
+        self.assertEqual(policy.watermark_collections, 1)
+
+        # Nothing allocated since, collecting again would not help
+        self.assertFalse(policy.after_burst(200))
+        self.assertEqual(policy.collections, 1)
+
+    def test_idle(self):
+        policy = FakeHeap(16384, 1000, 4096, 100, 0)
+        policy.after_burst(0)
+
+        policy.allocated = 8000
+        self.assertFalse(policy.on_idle(500))
+        self.assertTrue(policy.on_idle(1000))
+        self.assertEqual(policy.idle_collections, 1)
+
+        # Not enough new garbage
+        policy.allocated = 10000
+        self.assertFalse(policy.on_idle(5000))
+        self.assertEqual(policy.collections, 1)
+
+    def test_stats(self):
+        policy = GcPolicy()
+        elapsed = policy.collect()
+
+        self.assertEqual(policy.collections, 1)
+        self.assertEqual(policy.total_us, elapsed)
+        self.assertEqual(policy.max_us, elapsed)
+        self.assertTrue(str(policy).startswith("1 collections (0 watermark, 1 idle)"))
+
+
+if __name__ == "__main__":
+    unittest.main()
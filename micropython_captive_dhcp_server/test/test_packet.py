@@ -1,6 +1,20 @@
 import unittest
 import struct
-from ..packet import Header, Ip, DhcpOptions, DhcpMessageType, DhcpOffer
+from ..packet import (
+    Header,
+    Ip,
+    DhcpOptions,
+    DhcpMessageType,
+    DhcpOffer,
+    DhcpAck,
+    Codec,
+    OptionCodecs,
+    ReplyTemplate,
+    PacketPool,
+    Prefilter,
+    DhcpDiscover,
+    DhcpRequest,
+)
 
 
 class TestHeader(unittest.TestCase):
@@ -472,11 +486,250 @@ class TestHeader(unittest.TestCase):
         self.assertEqual(header.options[DhcpOptions.VENDOR_CLASS_ID], "android-dhcp-9")
         self.assertEqual(header.options[DhcpOptions.HOST_NAME], "Galaxy-S9")
         self.assertEqual(
-            header.options[DhcpOptions.PARAM_REQUEST_LIST], "1,3,6,15,26,28,51,58,59,43"
+            header.options[DhcpOptions.PARAM_REQUEST_LIST],
+            bytes([1, 3, 6, 15, 26, 28, 51, 58, 59, 43]),
+        )
+
+        self.assertEqual(
+            header.options[DhcpOptions.CLIENT_ID], b"\x01\x8c\x45\x00\x1d\x48\x16"
         )
 
         self.assertEqual(header.pack(), self.discover_android)
 
+    def test_option_codecs(self):
+        header = Header()
+        header.unpack(self.discover_linux)
+        header.options[DhcpOptions.DNS] = [
+            Ip.str_to_int("192.168.4.1"),
+            Ip.str_to_int("8.8.8.8"),
+        ]
+        header.options[DhcpOptions.REQUESTED_IP] = Ip.str_to_int("0.0.0.7")
+        header.options[250] = b"\x00\x00\x01"
+
+        packet = header.pack()
+        parsed = Header()
+        parsed.unpack(packet)
+
+        self.assertEqual(parsed.options, header.options)
+        self.assertIn('"6": ["192.168.4.1", "8.8.8.8"]', str(parsed))
+
+    def test_pack_large(self):
+        # Longer than MAX_PACKET_SIZE, pack_into with a fixed buffer would not fit
+        data = bytes(self.discover_linux[:240]) + b"".join(
+            [
+                b"\x35\x01\x03",
+                b"\xe0\xc8" + bytes(range(200)),
+                b"\xe1\xc8" + bytes(200),
+                b"\x0c\x09Galaxy-S9",
+                b"\xe2\xc8" + bytes(range(200, 0, -1)),
+                b"\xff",
+            ]
+        )
+        self.assertTrue(len(data) > Header.MAX_PACKET_SIZE)
+
+        for lazy in [False, True]:
+            header = Header()
+            header.unpack(data, lazy)
+            packet = header.pack()
+
+            # Option order follows the dict, which micropython does not keep
+            parsed = Header()
+            parsed.unpack(packet)
+            self.assertEqual(len(packet), len(data))
+            self.assertEqual(parsed.options, header.options)
+            self.assertEqual(packet[:240], data[:240])
+
+    def test_lazy_options(self):
+        for data in [
+            self.discover_android,
+            self.discover_linux,
+            self.request_linux,
+            self.offer_linux,
+            self.ack_linux,
+        ]:
+            eager = Header()
+            eager.unpack(data)
+            lazy = Header()
+            lazy.unpack(data, lazy=True)
+
+            self.assertEqual(lazy.options.values, {})
+            self.assertEqual(lazy.options, eager.options)
+            self.assertEqual(lazy.pack(), eager.pack())
+
+    def test_lazy_options_decode_on_access(self):
+        packet = Header.parse(self.discover_android, lazy=True)
+
+        self.assertEqual(
+            list(packet.header.options.values), [DhcpOptions.DHCP_MESSAGE_TYPE]
+        )
+        self.assertEqual(packet.header.options.get(DhcpOptions.REQUESTED_IP), None)
+        self.assertEqual(packet.header.options[DhcpOptions.HOST_NAME], "Galaxy-S9")
+
+        packet.header.options[DhcpOptions.HOST_NAME] = "phone"
+        del packet.header.options[DhcpOptions.VENDOR_CLASS_ID]
+        self.assertEqual(packet.header.options[DhcpOptions.HOST_NAME], "phone")
+        self.assertFalse(DhcpOptions.VENDOR_CLASS_ID in packet.header.options)
+
+    def test_packet_pool(self):
+        pool = PacketPool(1)
+
+        discover = pool.parse(self.discover_android)
+        self.assertTrue(isinstance(discover, DhcpDiscover))
+        self.assertEqual(discover.header.mac, "8c:45:00:1d:48:16")
+        self.assertEqual(discover.header.hwaddr, b"\x8c\x45\x00\x1d\x48\x16")
+        self.assertEqual(discover.header.options[DhcpOptions.HOST_NAME], "Galaxy-S9")
+        header = discover.header
+
+        # Exhausted pool falls back to a freshly parsed packet
+        request = pool.parse(self.request_linux)
+        self.assertTrue(isinstance(request, DhcpRequest))
+        self.assertFalse(request.header is header)
+        pool.release(request)
+
+        pool.release(discover)
+        pool.release(discover)
+        self.assertEqual(len(pool.free), 1)
+
+        request = pool.parse(self.request_linux)
+        self.assertTrue(request.header is header)
+        self.assertTrue(isinstance(request, DhcpRequest))
+
+        eager = Header()
+        eager.unpack(self.request_linux)
+        self.assertEqual(request.header.options, eager.options)
+        self.assertEqual(request.header.pack(), eager.pack())
+
+    def test_packet_pool_unknown_type(self):
+        pool = PacketPool(1)
+
+        self.assertEqual(pool.parse(self.rouge[:240]), None)
+        self.assertEqual(len(pool.free), 1)
+        self.assertEqual(pool.free[0].xid, 0)
+
+    def test_prefilter(self):
+        prefilter = Prefilter()
+
+        self.assertTrue(prefilter.accept(self.discover_android))
+        self.assertTrue(prefilter.accept(self.discover_linux))
+        self.assertTrue(prefilter.accept(self.request_linux))
+        self.assertTrue(prefilter.accept(self.rouge))
+        self.assertEqual(prefilter.check(b"junk"), Prefilter.TRUNCATED)
+        self.assertEqual(prefilter.check(self.offer_linux), Prefilter.NOT_REQUEST)
+
+        packet = bytearray(self.discover_linux)
+        packet[1] = 6
+        self.assertEqual(prefilter.check(packet), Prefilter.HARDWARE)
+
+        packet = bytearray(self.discover_linux)
+        packet[239] = 0
+        self.assertEqual(prefilter.check(packet), Prefilter.NO_MAGIC)
+
+        packet = bytearray(self.ack_linux)
+        packet[0] = 1
+        self.assertEqual(prefilter.check(packet), Prefilter.UNHANDLED_TYPE)
+
+        self.assertEqual(prefilter.counts[Prefilter.ACCEPTED], 4)
+        self.assertEqual(prefilter.dropped(), 0)
+        prefilter.accept(b"junk")
+        self.assertEqual(str(prefilter), "4 accepted, 1 truncated")
+
+    def test_prefilter_message_type(self):
+        prefilter = Prefilter()
+        header = bytes(self.discover_linux[:240])
+
+        # Pad octets and other options ahead of the message type
+        packet = header + b"\x00\x00\x0c\x05mario\x35\x01\x03\xff"
+        self.assertEqual(prefilter.check(packet), Prefilter.ACCEPTED)
+
+        for options in [
+            b"\x0c\x05mario\xff",
+            b"\x0c\x05mario\x35\x02\x01\x01\xff",
+            b"\x0c\x05mario\x35\x01",
+            b"\x0c\x40mario",
+        ]:
+            self.assertEqual(
+                prefilter.check(header + options), Prefilter.NO_MESSAGE_TYPE
+            )
+
+    def test_unpack_malformed(self):
+        header = bytes(self.discover_linux[:240])
+        parsed = Header()
+
+        self.assertFalse(parsed.unpack(b"junk"))
+        self.assertTrue(parsed.unpack(self.discover_linux))
+        self.assertTrue(parsed.unpack(header))
+        self.assertEqual(parsed.options, {})
+
+        # Pad octets are skipped, a missing end option is tolerated
+        for lazy in [False, True]:
+            self.assertTrue(parsed.unpack(header + b"\x00\x00\x35\x01\x01", lazy))
+            self.assertEqual(
+                parsed.options, {DhcpOptions.DHCP_MESSAGE_TYPE: 1}
+            )
+
+        # Options overrunning the packet end the walk
+        for options in [b"\x35\x01\x01\x0c", b"\x35\x01\x01\x0c\x40mario\xff"]:
+            for lazy in [False, True]:
+                self.assertFalse(parsed.unpack(header + options, lazy))
+                self.assertEqual(
+                    parsed.options, {DhcpOptions.DHCP_MESSAGE_TYPE: 1}
+                )
+
+        # Invalid utf-8 and partial addresses still decode
+        parsed.unpack(header + b"\x0c\x02\xff\xfe\x06\x06\x08\x08\x08\x08\x01\x01\xff")
+        self.assertEqual(parsed.options[DhcpOptions.HOST_NAME], b"\xff\xfe")
+        self.assertEqual(parsed.options[DhcpOptions.DNS], [0x08080808])
+        self.assertIn('"12": "fffe"', str(parsed))
+
+    def test_unpack_fuzz(self):
+        # Deterministic linear congruential generator, same on every runtime
+        state = [1]
+
+        def rand(n):
+            state[0] = (state[0] * 1103515245 + 12345) & 0x7FFFFFFF
+            return (state[0] >> 8) % n
+
+        pool = PacketPool(1)
+        prefilter = Prefilter()
+        fixtures = [
+            self.discover_android,
+            self.discover_linux,
+            self.request_linux,
+            self.offer_linux,
+            self.ack_linux,
+            self.rouge,
+        ]
+        for _ in range(300):
+            packet = bytearray(fixtures[rand(len(fixtures))])
+            for _ in range(1 + rand(8)):
+                packet[240 + rand(len(packet) - 240)] = rand(256)
+            packet = bytes(packet[: 236 + rand(len(packet) - 235)])
+
+            prefilter.check(packet)
+            for lazy in [False, True]:
+                header = Header()
+                header.unpack(packet, lazy)
+                for option_code in header.options:
+                    header.options[option_code]
+                str(header)
+            message = pool.parse(packet)
+            if message is not None:
+                pool.release(message)
+        self.assertEqual(len(pool.free), 1)
+
+    def test_register_option(self):
+        OptionCodecs.register(250, Codec.encode_u16, Codec.decode_uint)
+        try:
+            header = Header()
+            header.unpack(self.discover_linux)
+            header.options[250] = 1234
+
+            parsed = Header()
+            parsed.unpack(header.pack())
+            self.assertEqual(parsed.options[250], 1234)
+        finally:
+            del OptionCodecs.registry[250]
+
     def test_discover(self):
         packet = Header.parse(self.discover_linux)
         # print(packet)
@@ -501,7 +754,7 @@ class TestHeader(unittest.TestCase):
         self.assertEqual(packet.header.options[DhcpOptions.HOST_NAME], "mario")
         self.assertEqual(
             packet.header.options[DhcpOptions.PARAM_REQUEST_LIST],
-            "1,28,2,3,15,6,119,12,44,47,26,121,42",
+            bytes([1, 28, 2, 3, 15, 6, 119, 12, 44, 47, 26, 121, 42]),
         )
 
         self.assertEqual(packet.pack(), self.discover_linux)
@@ -576,6 +829,145 @@ class TestHeader(unittest.TestCase):
         )
         self.assertEqual(offer.header.options[DhcpOptions.LEASE_TIME], 86400)
 
+    def test_offer_template(self):
+        discover = Header.parse(self.discover_linux)
+        template = DhcpOffer.template("192.168.4.1", "255.255.255.0")
+        packet = DhcpOffer().answer(
+            discover, "192.168.4.250", "192.168.4.1", "255.255.255.0"
+        )
+
+        # Padded to the BOOTP minimum of 300 octets
+        self.assertEqual(
+            template.render(discover.header, Ip.str_to_int("192.168.4.250")),
+            packet + bytes(300 - len(packet)),
+        )
+
+    def test_offer_template_trimmed(self):
+        discover = Header.parse(self.discover_linux)
+        template = DhcpOffer.template("192.168.4.1", "255.255.255.0")
+        reply = template.render(
+            discover.header,
+            Ip.str_to_int("192.168.4.250"),
+            discover.header.options[DhcpOptions.PARAM_REQUEST_LIST],
+        )
+
+        option_codes = []
+        position = 240
+        while reply[position] != 255:
+            option_codes.append(reply[position])
+            position += 2 + reply[position + 1]
+        self.assertEqual(option_codes, [53, 54, 51, 1, 3, 6])
+        self.assertEqual(reply[position + 1 :], bytes(300 - position - 1))
+
+        offer = Header()
+        offer.unpack(reply)
+        self.assertEqual(offer.xid, discover.header.xid)
+        self.assertEqual(Ip.int_to_str(offer.yiaddr), "192.168.4.250")
+        self.assertEqual(
+            Ip.int_to_str(offer.options[DhcpOptions.SUBNET]), "255.255.255.0"
+        )
+
+    def test_reply_to(self):
+        template = DhcpOffer.template("192.168.4.1", "255.255.255.0")
+        discover = Header.parse(self.discover_linux)
+        yiaddr = Ip.str_to_int("192.168.4.250")
+
+        self.assertEqual(
+            bytes(template.reply_to(self.discover_linux, yiaddr)),
+            template.render(discover.header, yiaddr),
+        )
+
+        requested = discover.header.options[DhcpOptions.PARAM_REQUEST_LIST]
+        self.assertEqual(
+            bytes(template.reply_to(self.discover_linux, yiaddr, requested)),
+            template.render(discover.header, yiaddr, requested),
+        )
+
+        # Layout unchanged, only the echoed fields differ from the last reply
+        rouge = Header.parse(self.rouge)
+        reply = Header()
+        reply.unpack(bytes(template.reply_to(self.rouge, 0, requested)))
+        self.assertEqual(reply.op, 2)
+        self.assertEqual(reply.xid, rouge.header.xid)
+        self.assertEqual(reply.flags, 0x8000)
+        self.assertEqual(reply.mac, rouge.header.mac)
+        self.assertEqual(reply.yiaddr, 0)
+        self.assertEqual(len(reply.options), 6)
+
+        # hops and secs are never echoed
+        relayed = bytearray(self.discover_linux)
+        relayed[3] = 1
+        relayed[8:10] = b"\x00\x05"
+        reply.unpack(bytes(template.reply_to(relayed, yiaddr)))
+        self.assertEqual(reply.hops, 0)
+        self.assertEqual(reply.secs, 0)
+        self.assertEqual(reply.xid, discover.header.xid)
+
+    def test_template_repeated_request(self):
+        discover = Header.parse(self.discover_linux)
+        reply = DhcpOffer()
+        reply.answer(discover, "192.168.4.250", "192.168.4.1", "255.255.255.0")
+        reply.header.options[DhcpOptions.DOMAIN_NAME] = "d" * 200
+        reply.header.options[DhcpOptions.CAPTIVE_URI] = "u" * 80
+        template = ReplyTemplate(reply.pack())
+
+        def option_codes(reply):
+            option_codes = []
+            position = 240
+            while reply[position] != 255:
+                option_codes.append(reply[position])
+                position += 2 + reply[position + 1]
+            return option_codes
+
+        # Each option is written once, however often the client asks for it
+        requested = b"\x01\x01\x35\x01\x03"
+        reply = template.render(discover.header, 0, requested)
+        self.assertEqual(option_codes(reply), [53, 54, 51, 1, 3])
+
+        # Repeats are not counted against the client's limit either, so
+        # nothing is dropped from a reply that fits the default 576 octets
+        requested = b"\x01\x0f\x0f\x72\x01\x72"
+        reply = template.render(discover.header, 0, requested)
+        self.assertEqual(option_codes(reply), [53, 54, 51, 1, 15, 114])
+        self.assertEqual(len(reply), 546)
+
+    def test_ack_template(self):
+        request = Header.parse(self.request_linux)
+        template = DhcpAck.template("192.168.4.1", "255.255.255.0")
+
+        packet = DhcpAck().answer(request, "192.168.4.1", "255.255.255.0")
+
+        self.assertEqual(
+            template.render(
+                request.header, request.header.options[DhcpOptions.REQUESTED_IP]
+            ),
+            packet + bytes(300 - len(packet)),
+        )
+
+    def test_template_max_message_size(self):
+        discover = Header.parse(self.discover_linux)
+        reply = DhcpOffer()
+        reply.answer(discover, "192.168.4.250", "192.168.4.1", "255.255.255.0")
+        reply.header.options[DhcpOptions.DOMAIN_NAME] = "d" * 200
+        reply.header.options[DhcpOptions.CAPTIVE_URI] = "u" * 80
+        template = ReplyTemplate(reply.pack())
+
+        self.assertEqual(ReplyTemplate.size_limit(None), 548)
+        self.assertEqual(ReplyTemplate.size_limit(300), 548)
+        self.assertEqual(ReplyTemplate.size_limit(1500), 1472)
+
+        # Fits a 1500 octet limit but not the default 576
+        self.assertEqual(len(template.render(discover.header, 0, None, 1500)), 558)
+        packet = template.render(discover.header, 0)
+        self.assertEqual(len(packet), 356)
+
+        # The domain name goes first, the captive portal URI is kept
+        parsed = Header()
+        parsed.unpack(packet)
+        self.assertFalse(DhcpOptions.DOMAIN_NAME in parsed.options)
+        self.assertEqual(parsed.options[DhcpOptions.CAPTIVE_URI], "u" * 80)
+        self.assertEqual(parsed.options[DhcpOptions.DHCP_MESSAGE_TYPE], 2)
+
     def test_request(self):
         packet = Header.parse(self.request_linux)
         # print(packet)
@@ -604,7 +996,7 @@ class TestHeader(unittest.TestCase):
         self.assertEqual(packet.header.options[DhcpOptions.HOST_NAME], "mario")
         self.assertEqual(
             packet.header.options[DhcpOptions.PARAM_REQUEST_LIST],
-            "1,28,2,3,15,6,119,12,44,47,26,121,42",
+            bytes([1, 28, 2, 3, 15, 6, 119, 12, 44, 47, 26, 121, 42]),
         )
 
         self.assertEqual(packet.pack(), self.request_linux)
@@ -652,6 +1044,22 @@ class TestHeader(unittest.TestCase):
 
     def test_ip(self):
         self.assertEqual("192.168.1.5", Ip.next_ip("192.168.1.4"))
+        self.assertEqual("192.168.2.0", Ip.next_ip("192.168.1.255"))
+
+    def test_ip_conversion(self):
+        self.assertEqual(Ip.str_to_int("192.168.4.1"), 0xC0A80401)
+        self.assertEqual(Ip.str_to_int("255.255.255.255"), 0xFFFFFFFF)
+        self.assertEqual(Ip.str_to_byte("10.0.0.1"), b"\x0a\x00\x00\x01")
+        self.assertEqual(Ip.int_to_str(0), "0.0.0.0")
+        self.assertEqual(Ip.int_to_str(0xC0A80401), "192.168.4.1")
+        self.assertEqual(Ip.int_to_str(0xFFFFFFFF), "255.255.255.255")
+
+    def test_ip_cache_is_bounded(self):
+        for i in range(Ip.CACHE_SIZE * 2):
+            self.assertEqual(
+                Ip.int_to_str(0x0A000000 + i), "10.0.{}.{}".format(i >> 8, i & 0xFF)
+            )
+            self.assertLessEqual(len(Ip.cache), Ip.CACHE_SIZE)
 
 
 if __name__ == "__main__":
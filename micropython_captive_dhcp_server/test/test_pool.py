@@ -0,0 +1,88 @@
+import unittest
+from ..packet import Ip
+from ..pool import AddressPool
+
+
+class TestAddressPool(unittest.TestCase):
+    def test_from_subnet(self):
+        pool = AddressPool.from_subnet(
+            Ip.str_to_int("192.168.4.1"), Ip.str_to_int("255.255.255.0")
+        )
+
+        self.assertEqual(Ip.int_to_str(pool.start), "192.168.4.1")
+        self.assertEqual(Ip.int_to_str(pool.end), "192.168.4.254")
+        self.assertEqual(pool.free, 253)
+        self.assertEqual(Ip.int_to_str(pool.allocate()), "192.168.4.2")
+        self.assertEqual(Ip.int_to_str(pool.allocate()), "192.168.4.3")
+
+    def test_never_hands_out_reserved_addresses(self):
+        netmask = Ip.str_to_int("255.255.255.248")
+        server_ip = Ip.str_to_int("10.0.0.3")
+        pool = AddressPool(
+            Ip.str_to_int("10.0.0.0"), Ip.str_to_int("10.0.0.7"), netmask, server_ip
+        )
+
+        ips = []
+        ip = pool.allocate()
+        while ip is not None:
+            ips.append(Ip.int_to_str(ip))
+            ip = pool.allocate()
+
+        self.assertEqual(
+            ips, ["10.0.0.1", "10.0.0.2", "10.0.0.4", "10.0.0.5", "10.0.0.6"]
+        )
+        self.assertEqual(pool.free, 0)
+
+    def test_release(self):
+        pool = AddressPool.from_subnet(
+            Ip.str_to_int("192.168.4.1"), Ip.str_to_int("255.255.255.0")
+        )
+        first = pool.allocate()
+        second = pool.allocate()
+
+        self.assertTrue(pool.release(first))
+        self.assertFalse(pool.release(first))
+        self.assertFalse(pool.release(Ip.str_to_int("192.168.5.1")))
+        self.assertFalse(pool.in_use(first))
+        self.assertTrue(pool.in_use(second))
+
+        # Exhausting the pool hands the released address back out
+        ips = set()
+        ip = pool.allocate()
+        while ip is not None:
+            ips.add(ip)
+            ip = pool.allocate()
+        self.assertIn(first, ips)
+        self.assertEqual(pool.free, 0)
+
+    def test_reserve(self):
+        pool = AddressPool.from_subnet(
+            Ip.str_to_int("192.168.4.1"), Ip.str_to_int("255.255.255.0")
+        )
+
+        self.assertTrue(pool.reserve(Ip.str_to_int("192.168.4.2")))
+        self.assertFalse(pool.reserve(Ip.str_to_int("192.168.4.2")))
+        self.assertEqual(Ip.int_to_str(pool.allocate()), "192.168.4.3")
+
+    def test_large_pool(self):
+        pool = AddressPool.from_subnet(
+            Ip.str_to_int("172.16.0.1"), Ip.str_to_int("255.255.0.0")
+        )
+
+        self.assertEqual(len(pool.bitmap), 8192)
+        self.assertEqual(pool.free, 65533)
+        for _ in range(1000):
+            pool.allocate()
+        self.assertEqual(pool.free, 64533)
+
+    def test_empty_pool(self):
+        with self.assertRaises(ValueError):
+            AddressPool(
+                Ip.str_to_int("10.0.0.0"),
+                Ip.str_to_int("10.0.0.1"),
+                Ip.str_to_int("255.255.255.254"),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
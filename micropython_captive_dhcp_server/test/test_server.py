@@ -0,0 +1,187 @@
+import unittest
+from ..cache import ReplyCache
+from ..lease import LeaseTable, TimerWheel
+from ..log import Logger, RingSink
+from ..packet import Header, Ip, DhcpOptions
+from . import test_packet
+
+try:
+    from ..server import CaptiveDhcpServer
+except ImportError:
+    # The server needs usocket and uasyncio, only found on micropython
+    CaptiveDhcpServer = None
+
+
+class FakeSocket:
+    def __init__(self, error=None):
+        self.sent = []
+        self.error = error
+
+    def sendto(self, data, addr):
+        if self.error is not None:
+            raise self.error
+        self.sent.append(bytes(data))
+
+
+class TestCaptiveDhcpServer(unittest.TestCase):
+    header = bytes(test_packet.TestHeader.discover_linux[:240])
+
+    def make_server(self, max_leases: int = 128, replies=None, level=Logger.INFO):
+        if CaptiveDhcpServer is None:
+            self.skipTest("needs usocket and uasyncio")
+        if replies is None:
+            replies = ReplyCache(0)
+        sink = RingSink(16)
+        server = CaptiveDhcpServer(
+            max_leases=max_leases,
+            log=Logger(level, Logger.ALL, sink),
+            replies=replies,
+        )
+        server.configure("192.168.4.1", "255.255.255.0")
+        server.sock = FakeSocket()
+        return server, sink
+
+    def test_empty_client_id(self):
+        server, sink = self.make_server()
+        free = server.pool.free
+
+        # Zero length client identifier, leased by hardware address instead
+        for _ in range(3):
+            server.handle(self.header + b"\x35\x01\x01\x3d\x00\xff")
+        self.assertEqual(len(server.sock.sent), 3)
+        self.assertEqual(len(server.leases), 1)
+        self.assertEqual(server.pool.free, free - 1)
+
+        # A key the lease table cannot store gives the address back
+        self.assertEqual(server.get_free_ip(b""), None)
+        self.assertEqual(server.pool.free, free - 1)
+
+    def test_request_without_requested_ip(self):
+        server, sink = self.make_server()
+        request = self.header + b"\x35\x01\x03\xff"
+
+        # No option 50, no ciaddr and no lease: nothing to ack
+        server.handle(request)
+        self.assertEqual(server.sock.sent, [])
+        self.assertEqual(server.errors.counts, {"Request without an address to ack": 1})
+
+        # Once leased, the lease address is acked
+        server.handle(self.header + b"\x35\x01\x01\xff")
+        server.handle(request)
+        self.assertEqual(len(server.sock.sent), 2)
+        ack = Header()
+        ack.unpack(server.sock.sent[1])
+        self.assertEqual(ack.options[DhcpOptions.DHCP_MESSAGE_TYPE], 5)
+        self.assertEqual(ack.yiaddr, Ip.str_to_int("192.168.4.2"))
+        self.assertEqual(len(server.errors), 1)
+
+    def test_request_for_leased_address(self):
+        server, sink = self.make_server()
+        discover = self.header + b"\x35\x01\x01\xff"
+        other = bytearray(self.header)
+        other[33] ^= 1
+        other = bytes(other)
+
+        def acked(data, requested):
+            sent = len(server.sock.sent)
+            server.handle(data + b"\x35\x01\x03\x32\x04" + requested + b"\xff")
+            if len(server.sock.sent) == sent:
+                return None
+            ack = Header()
+            ack.unpack(server.sock.sent[-1])
+            return Ip.int_to_str(ack.yiaddr)
+
+        server.handle(discover)
+        self.assertEqual(len(server.leases), 1)
+
+        # Another client rebooting with the first client's address
+        self.assertEqual(acked(other, b"\xc0\xa8\x04\x02"), None)
+        # A free address is leased to it
+        self.assertEqual(acked(other, b"\xc0\xa8\x04\x09"), "192.168.4.9")
+        self.assertEqual(len(server.leases), 2)
+        self.assertTrue(server.pool.in_use(Ip.str_to_int("192.168.4.9")))
+        # A client holding a lease is acked with it
+        self.assertEqual(acked(self.header, b"\xc0\xa8\x04\x09"), "192.168.4.2")
+
+        server.handle(discover)
+        self.assertEqual(len(server.leases), 2)
+
+    def test_offer_hold(self):
+        server, sink = self.make_server(max_leases=4)
+        server.expiry = TimerWheel(
+            server.EXPIRY_SLOTS, server.EXPIRY_RESOLUTION, now=0, capacity=4
+        )
+        other = bytearray(self.header)
+        other[33] ^= 1
+        other = bytes(other)
+
+        # Both clients are offered an address, only the first one acks it
+        server.handle(self.header + b"\x35\x01\x01\xff")
+        server.handle(other + b"\x35\x01\x01\xff")
+        server.handle(self.header + b"\x35\x01\x03\xff")
+        bound = server.leases.find(self.header[28:34])
+        offered = server.leases.find(other[28:34])
+        self.assertEqual(server.leases.states[bound], LeaseTable.BOUND)
+        self.assertEqual(server.leases.states[offered], LeaseTable.OFFERED)
+
+        hold = server.OFFER_HOLD * 1000 + server.EXPIRY_RESOLUTION
+        self.assertEqual(server.expiry.advance(hold), [offered])
+        self.assertIn(bound, server.expiry)
+
+    def test_malformed_flood(self):
+        server, sink = self.make_server()
+        sink.clear()
+
+        # Passes the prefilter, the hostname overruns the datagram
+        for _ in range(200):
+            server.handle(self.header + b"\x35\x01\x01\x0c\x40mario\xff")
+        self.assertEqual(str(server.prefilter), "200 malformed")
+        self.assertEqual(len(sink), 0)
+        self.assertEqual(server.sock.sent, [])
+
+    def test_lease_table_full(self):
+        server, sink = self.make_server(max_leases=1)
+        sink.clear()
+
+        for i in range(5):
+            discover = bytearray(self.header + b"\x35\x01\x01\xff")
+            discover[33] = i
+            server.handle(bytes(discover))
+        self.assertEqual(len(server.sock.sent), 1)
+        self.assertEqual(
+            server.errors.counts, {"Address pool or lease table exhausted": 4}
+        )
+        self.assertEqual(
+            len([line for line in sink.lines() if "exhausted" in line]), 1
+        )
+
+    def test_retransmit_policy(self):
+        discover = self.header + b"\x35\x01\x01\xff"
+
+        for policy, sent, message in (
+            (ReplyCache.REPLAY, 2, "Retransmit, answered from cache"),
+            (ReplyCache.DROP, 1, "Retransmit, dropped"),
+        ):
+            server, sink = self.make_server(
+                replies=ReplyCache(policy=policy), level=Logger.DEBUG
+            )
+            server.handle(discover)
+            sink.clear()
+            server.handle(discover)
+            self.assertEqual(len(server.sock.sent), sent)
+            self.assertIn(message, [line[-len(message) :] for line in sink.lines()])
+
+    def test_send_failures_are_rate_limited(self):
+        server, sink = self.make_server()
+        server.sock = FakeSocket(OSError(12))
+
+        for _ in range(5):
+            server.handle(self.header + b"\x35\x01\x01\xff")
+        self.assertEqual(server.errors.counts, {"OSError": 5})
+        self.assertEqual(
+            len([line for line in sink.lines() if "OSError" in line]), 1
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()